@@ -1,6 +1,6 @@
-from typing import Any
+from typing import Any, TypeGuard
 
-from sympy import Basic, Expr, S, Symbol, false, true
+from sympy import Basic, Expr, S, Symbol, false, preorder_traversal, true
 
 from estimates.order_of_magnitude import OrderSymbol
 from estimates.proposition import Proposition
@@ -101,6 +101,10 @@ class Type(Basic):
     A bare‐bones SymPy object to capture the "type" of of other SymPy expressions.  Used here to encode variable declarations: "x : int", for instance, is encoded as "x : Type(Symbol("x", integer=True))".
     """
 
+    def __init_subclass__(cls, **kwargs: object) -> None:
+        super().__init_subclass__(**kwargs)
+        TYPE_CLASSES.add(cls)
+
     def __new__(cls, *args):
         assert len(args) == 1, "Type requires exactly one argument."
         # force args into a tuple and pass to Basic
@@ -117,6 +121,14 @@ class Type(Basic):
         return f"Type({self.args})"
 
 
+TYPE_CLASSES: set[type[Type]] = {Type}  # Type and all of its subclasses, so that is_decl() can recognize variable declarations with an exact type lookup, which is faster than isinstance()
+
+
+def is_decl(obj: object) -> TypeGuard[Type]:
+    """Return True if obj is a variable declaration, that is, an instance of Type or of one of its subclasses."""
+    return type(obj) in TYPE_CLASSES
+
+
 def describe(name: str, object: Basic) -> str:
     """Return a string description of a named sympy object."""
     return f"{name}: {object}"
@@ -125,6 +137,18 @@ def describe(name: str, object: Basic) -> str:
 def is_defined(expr: Any, vars: set[Basic]) -> bool:
     """Check if expr is defined in terms of the set `vars` of other expressions"""
     expr = S(expr)
+    # In the common case every leaf of expr is a variable or a constant, and a single pass over the leaves suffices.
+    if all(
+        node in vars or node.is_number or node in (true, false)
+        for node in preorder_traversal(expr)
+        if not node.args
+    ):
+        return True
+    return _is_defined(expr, vars)
+
+
+def _is_defined(expr: Basic, vars: set[Basic]) -> bool:
+    """The recursive part of is_defined, which also accepts subexpressions such as sums that are constants as a whole."""
     if expr in vars:
         return True
     if expr.is_number:
@@ -133,4 +157,4 @@ def is_defined(expr: Any, vars: set[Basic]) -> bool:
         return True
     if len(expr.args) == 0:
         return False
-    return all(is_defined(arg, vars) for arg in expr.args)
+    return all(_is_defined(arg, vars) for arg in expr.args)
@@ -209,7 +209,7 @@ class LogLinarith(Tactic):
 
     def activate(self, state: ProofState) -> list[ProofState]:
         # First, gather all the hypotheses that can generate inequalities.
-        if false in state.list_hypotheses() or state.goal == true:
+        if false in state.iter_hypotheses() or state.goal == true:
             print("Goal trivially follows from hypotheses.")
             return []
 
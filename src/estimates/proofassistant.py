@@ -1,9 +1,9 @@
 from sympy import Basic, S, Expr
 from sympy.logic.boolalg import Boolean
 
-from estimates.basic import Type, describe, is_defined, new_var
+from estimates.basic import Type, is_decl, is_defined, new_var
 from estimates.lemma import Lemma, UseLemma
-from estimates.proofstate import ProofState
+from estimates.proofstate import MISSING, Hypotheses, ProofState
 from estimates.prooftree import ProofTree
 from estimates.tactic import Tactic
 
@@ -15,16 +15,20 @@ from estimates.tactic import Tactic
 
 class ProofAssistant:
     mode : str                      # either "assumption" or "tactic"   
-    hypotheses : dict[str, Basic]   # a dictionary of (str, Basic) pairs
-    theorem_str : str               # a description of the theorem
+    hypotheses : Hypotheses         # a dictionary of (str, Basic) pairs
+    _theorem_hyps : Hypotheses      # the hypotheses of the theorem being proved
+    _theorem_goal : Basic | None    # the goal of the theorem being proved
+    _theorem_str : str | None       # a description of the theorem, or None if it has not been built yet
     proof_tree : ProofTree | None   # the root of the proof tree
     current_node : ProofTree | None # the current node in the proof tree
     auto_finish : bool              # whether one automatically finishes the proof when all sorries are cleared
 
     def __init__(self) -> None:
         self.mode = "assumption"
-        self.hypotheses = {}  
-        self.theorem_str = "" 
+        self.hypotheses = Hypotheses()
+        self._theorem_hyps = Hypotheses()
+        self._theorem_goal = None
+        self._theorem_str = None
         self.proof_tree = None 
         self.current_node = None 
         self.auto_finish = True
@@ -34,12 +38,11 @@ class ProofAssistant:
         if self.mode == "assumption":
             if not isinstance(assumption, Boolean):
                 raise ValueError(f"Assumption {assumption} is not a proposition.")
-            if not is_defined(assumption, self.get_all_vars()):
+            if not self.has_vars(assumption):
                 raise ValueError(
                     f"Assumption {assumption} is not defined in terms of the current variables."
                 )
-            while name in self.hypotheses:  # avoid namespace collisions
-                name += "'"
+            name = self.hypotheses.new(name)  # avoid namespace collisions
             self.hypotheses[name] = assumption
         else:
             raise ValueError(
@@ -61,8 +64,7 @@ class ProofAssistant:
     def var(self, type: str, name: str = "this") -> Expr:
         """Introduce a variable of a given type, stored as a Tuple wrapper around a sympy variable of the same type."""
         if self.mode == "assumption":
-            while name in self.hypotheses:  # avoid namespace collisions
-                name += "'"
+            name = self.hypotheses.new(name)  # avoid namespace collisions
             obj = new_var(type, name)
             self.hypotheses[name] = Type(obj)
             return obj
@@ -74,9 +76,13 @@ class ProofAssistant:
     def vars(self, type: str, *names: str) -> list[Expr]:
         """Introduce a list of variables of a given type."""
         if self.mode == "assumption":
+            hypotheses = self.hypotheses
             varlist = []
             for name in names:
-                varlist.append(self.var(type, name))
+                fresh = hypotheses.new(name)  # avoid namespace collisions
+                obj = new_var(type, fresh)
+                hypotheses[fresh] = Type(obj)  # also records the variable in the variable indices
+                varlist.append(obj)
             return varlist
         else:
             raise ValueError(
@@ -86,7 +92,7 @@ class ProofAssistant:
     def clear_hypotheses(self) -> None:
         """Clear the list of hypotheses."""
         if self.mode == "assumption":
-            self.hypotheses = {}  # clear the hypotheses
+            self.hypotheses = Hypotheses()  # clear the hypotheses
         else:
             raise ValueError(
                 "Cannot clear hypotheses in tactic mode.  Please switch to assumption mode."
@@ -105,26 +111,26 @@ class ProofAssistant:
     def get_hypothesis(self, name: str) -> Basic:
         """Get a hypothesis from the list of assumptions (in Assumption mode) or proof state (in Tactic mode)."""
         if self.mode == "assumption":
-            assert name in self.hypotheses, (
+            obj = self.hypotheses.get(name, MISSING)
+            assert obj is not MISSING, (
                 f"Hypothesis {name} not found in lisat of assumptions."
             )
-            obj = self.hypotheses[name]
-            if isinstance(obj, Type):
+            if is_decl(obj):
                 raise ValueError(
                     f"Hypothesis {name} is a variable declaration.  Use get_var() to get the variable."
                 )
-            return self.hypotheses[name]
+            return obj
         else:
             return self.get_state().get_hypothesis(name)
 
     def get_var(self, name: str) -> Basic:
         """Get a variable from the list of assumptions (in Assumption mode) or proof state (in Tactic mode)."""
         if self.mode == "assumption":
-            assert name in self.hypotheses, (
+            obj = self.hypotheses.get(name, MISSING)
+            assert obj is not MISSING, (
                 f"Variable {name} not found in list of assumptions."
             )
-            obj = self.hypotheses[name]
-            if isinstance(obj, Type):
+            if is_decl(obj):
                 return obj.var()
             else:
                 raise ValueError(
@@ -135,42 +141,53 @@ class ProofAssistant:
 
     def get_vars(self, *names: str) -> list[Basic]:
         """Get a list of variables from the list of assumptions (in Assumption mode) or proof state (in Tactic mode)."""
+        # resolve the mode and the hypotheses once, rather than once per name via get_var()
+        if self.mode == "assumption":
+            hypotheses = self.hypotheses
+            location = "list of assumptions"
+        else:
+            hypotheses = self.get_state().hypotheses
+            location = "proof state"
         varlist = []
         for name in names:
-            varlist.append(self.get_var(name))
+            obj = hypotheses.get(name, MISSING)
+            assert obj is not MISSING, f"Variable {name} not found in {location}."
+            if not is_decl(obj):
+                raise ValueError(
+                    f"Hypothesis {name} is a hypothesis, not a variable.  Use get_hypothesis() to get the hypothesis."
+                )
+            varlist.append(obj.var())
         return varlist
 
     def get_all_vars(self) -> set[Basic]:
         """Get all variables from the list of assumptions (in Assumption mode) or proof state (in Tactic mode)."""
         if self.mode == "assumption":
-            return {
-                obj.var() for obj in self.hypotheses.values() if isinstance(obj, Type)
-            }
+            return self.hypotheses.get_all_vars()
         else:
             return self.get_state().get_all_vars()
 
+    def has_vars(self, expr: Basic) -> bool:
+        """Check if expr is defined in terms of the current variables, using the same rule as the tactics."""
+        return is_defined(expr, self.get_all_vars())
+
     def begin_proof(self, goal: Basic) -> None:
         """Start a proof with a given goal."""
-        goal = S(goal)  # convert to a sympy expression
+        if not isinstance(goal, Basic):
+            goal = S(goal)  # convert to a sympy expression
         if self.mode == "assumption":
             if not isinstance(goal, Boolean):
                 raise ValueError(f"Goal {goal} is not a proposition.")
-            if not is_defined(goal, self.get_all_vars()):
+            if not self.has_vars(goal):
                 raise ValueError(
                     f"Goal {goal} is not defined in terms of the current variables."
                 )
             self.mode = "tactic"
             self.proof_tree = ProofTree(ProofState(goal, self.hypotheses))
             self.current_node = self.proof_tree
-            self.theorem_str = "example "
-            self.theorem_str += " ".join(
-                [
-                    f"({describe(name, hypothesis)})"
-                    for name, hypothesis in self.hypotheses.items()
-                ]
-            )
-            self.theorem_str += f": {goal}"
-            self.hypotheses = {}
+            self._theorem_hyps = self.hypotheses.copy()
+            self._theorem_goal = goal
+            self._theorem_str = None  # built on demand by theorem_str
+            self.hypotheses = Hypotheses()
             print("Starting proof.  Current proof state:")
             print(self.current_proof_state())
         else:
@@ -178,6 +195,22 @@ class ProofAssistant:
                 "Cannot start a proof in tactic mode.  Please switch to assumption mode."
             )
 
+    @property
+    def theorem_str(self) -> str:
+        """A description of the theorem being proved."""
+        if self._theorem_str is None:
+            if self._theorem_goal is None:
+                return ""  # no theorem is being proved
+            self._theorem_str = "example "
+            self._theorem_str += " ".join(
+                [
+                    f"({self._theorem_hyps.describe(name)})"
+                    for name in self._theorem_hyps
+                ]
+            )
+            self._theorem_str += f": {self._theorem_goal}"
+        return self._theorem_str
+
     def current_proof_state(self) -> ProofState:
         """Return the current proof state."""
         assert self.current_node is not None, "Current node is not initialized."
@@ -187,7 +220,7 @@ class ProofAssistant:
         """Return the current goal."""
         return self.current_proof_state().goal
 
-    def current_hypotheses(self) -> dict[str, Basic]:
+    def current_hypotheses(self) -> Hypotheses:
         """Return the current hypotheses."""
         assert self.current_node is not None, "Current node is not initialized."
         return self.current_node.proof_state.hypotheses
@@ -198,8 +231,10 @@ class ProofAssistant:
             self.mode = "assumption"
             self.proof_tree = None
             self.current_node = None
-            self.theorem_str = ""
-            self.hypotheses = {}
+            self._theorem_hyps = Hypotheses()
+            self._theorem_goal = None
+            self._theorem_str = None
+            self.hypotheses = Hypotheses()
         else:
             raise ValueError(
                 "Cannot abandon a proof in assumption mode.  Please start a proof first."
@@ -238,8 +273,9 @@ class ProofAssistant:
 
     def status(self) -> None:
         """Print the current status of the proof."""
-        assert self.proof_tree is not None, "Proof tree is not initialized."
-        n = self.proof_tree.num_sorries()
+        tree = self.proof_tree
+        assert tree is not None, "Proof tree is not initialized."
+        n = tree.num_sorries()
         if n == 0:
             print("Proof complete!")
         elif n == 1:
@@ -252,12 +288,14 @@ class ProofAssistant:
         if not (isinstance(tactic, Tactic)):
             raise ValueError(f"Tactic {tactic} is not a valid tactic.")
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            assert self.current_node is not None, "Current node is not initialized."
-            if not self.current_node.use_tactic(tactic):
+            tree = self.proof_tree
+            node = self.current_node
+            assert tree is not None, "Proof tree is not initialized."
+            assert node is not None, "Current node is not initialized."
+            if not node.use_tactic(tactic):
                 return  # Tactic did nothing, so don't change the current node
             self.status()
-            _, before, after = self.proof_tree.find_sorry(self.current_node)
+            _, before, after = tree.find_sorry(node)
             if after is not None:
                 self.current_node = after
             elif before is not None:
@@ -286,17 +324,15 @@ class ProofAssistant:
     def set_current_node(self, node: ProofTree) -> None:
         """Set the current node to a given node in the proof tree."""
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            if node in self.proof_tree.list_sorries():
-                self.current_node = node
-                _, num_before, num_after = self.proof_tree.count_sorries(
-                    self.current_node
-                )
+            tree = self.proof_tree
+            assert tree is not None, "Proof tree is not initialized."
+            self.current_node = node
+            if tree.has_sorry(node):
+                _, num_before, num_after = tree.count_sorries(node)
                 print(
                     f"Moved to goal {num_before + 1} of {num_before + 1 + num_after}."
                 )
             else:
-                self.current_node = node
                 print(f'Moved to a proof state currently handled by "{node.tactic}").')
         else:
             raise ValueError("Cannot set current node in assumption mode.")
@@ -304,9 +340,11 @@ class ProofAssistant:
     def next_goal(self) -> None:
         """Move to the next goal in the proof tree."""
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            assert self.current_node is not None, "Current node is not initialized."
-            _, _, after = self.proof_tree.find_sorry(self.current_node)
+            tree = self.proof_tree
+            node = self.current_node
+            assert tree is not None, "Proof tree is not initialized."
+            assert node is not None, "Current node is not initialized."
+            _, _, after = tree.find_sorry(node)
             if after is not None:
                 self.set_current_node(after)
             else:
@@ -317,9 +355,11 @@ class ProofAssistant:
     def previous_goal(self) -> None:
         """Move to the previous goal in the proof tree."""
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            assert self.current_node is not None, "Current node is not initialized."
-            _, before, _ = self.proof_tree.find_sorry(self.current_node)
+            tree = self.proof_tree
+            node = self.current_node
+            assert tree is not None, "Proof tree is not initialized."
+            assert node is not None, "Current node is not initialized."
+            _, before, _ = tree.find_sorry(node)
             if before is not None:
                 self.set_current_node(before)
             else:
@@ -330,8 +370,9 @@ class ProofAssistant:
     def first_goal(self) -> None:
         """Move to the first goal in the proof tree."""
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            first = self.proof_tree.first_sorry()
+            tree = self.proof_tree
+            assert tree is not None, "Proof tree is not initialized."
+            first = tree.first_sorry()
             if first is not None:
                 self.set_current_node(first)
             else:
@@ -342,8 +383,9 @@ class ProofAssistant:
     def last_goal(self) -> None:
         """Move to the last goal in the proof tree."""
         if self.mode == "tactic":
-            assert self.proof_tree is not None, "Proof tree is not initialized."
-            last = self.proof_tree.last_sorry()
+            tree = self.proof_tree
+            assert tree is not None, "Proof tree is not initialized."
+            last = tree.last_sorry()
             if last is not None:
                 self.set_current_node(last)
             else:
@@ -354,9 +396,10 @@ class ProofAssistant:
     def go_back(self) -> None:
         """Move back a node in the proof tree."""
         if self.mode == "tactic":
-            assert self.current_node is not None, "Current node is not initialized."
-            if self.current_node.parent is not None:
-                self.set_current_node(self.current_node.parent)
+            node = self.current_node
+            assert node is not None, "Current node is not initialized."
+            if node.parent is not None:
+                self.set_current_node(node.parent)
                 print("Moved back a step in the proof.")
             else:
                 print("Already at start of proof.")
@@ -366,16 +409,19 @@ class ProofAssistant:
     def go_forward(self, case: int = 1) -> None:
         """Move forward a node in the proof tree."""
         if self.mode == "tactic":
-            assert self.current_node is not None, "Current node is not initialized."
-            if len(self.current_node.children) == 0:
+            node = self.current_node
+            assert node is not None, "Current node is not initialized."
+            children = node.children
+            if len(children) == 0:
                 print("There are no more steps in this branch of the proof.")
-            elif case > len(self.current_node.children):
+            elif case > len(children):
                 print(
                     "There are only {len(self.current_node.children)} cases after this step of the proof."
                 )
             else:
-                self.set_current_node(self.current_node.children[case - 1])
-                if len(self.current_node.children) == 1:
+                new_node = children[case - 1]
+                self.set_current_node(new_node)
+                if len(new_node.children) == 1:
                     print("Moved forward a step in the proof.")
                 elif case == 1:
                     print("Moved forward to the first case of this step in the proof.")
@@ -391,12 +437,13 @@ class ProofAssistant:
     def undo(self) -> None:
         """Undo the last step in the proof tree."""
         if self.mode == "tactic":
-            assert self.current_node is not None, "Current node is not initialized."
-            if self.current_node.parent is not None:
-                self.set_current_node(self.current_node.parent)
-                print(f"Undid previous tactic ({self.current_node.tactic}).")
-                self.current_node.tactic = None  # clear the tactic
-                self.current_node.children = []  # clear the children
+            node = self.current_node
+            assert node is not None, "Current node is not initialized."
+            parent = node.parent
+            if parent is not None:
+                self.set_current_node(parent)
+                print(f"Undid previous tactic ({parent.tactic}).")
+                parent.clear_tactic()  # clear the tactic and its children
             else:
                 print("No tactics to undo.")
         else:
@@ -404,10 +451,11 @@ class ProofAssistant:
 
     def list_goals(self) -> None:
         """Print all the goals in the proof tree."""
-        assert self.proof_tree is not None, "Proof tree is not initialized."
-        N = self.proof_tree.num_sorries()
+        tree = self.proof_tree
+        assert tree is not None, "Proof tree is not initialized."
+        N = tree.num_sorries()
         count = 1
-        for node in self.proof_tree.list_sorries():
+        for node in tree.list_sorries():
             print(f"Goal {count} of {N}:")
             count += 1
             print(node.proof_state)
@@ -419,31 +467,29 @@ class ProofAssistant:
             else:
                 output = "Proof Assistant is in assumption mode.  Current hypotheses:\n"
                 output += "\n".join(
-                    [
-                        describe(name, hypothesis)
-                        for name, hypothesis in self.hypotheses.items()
-                    ]
+                    [self.hypotheses.describe(name) for name in self.hypotheses]
                 )
                 return output
         else:
+            node = self.current_node
+            assert node is not None, "Current node is not initialized."
             output = "Proof Assistant is in tactic mode.  Current proof state:\n"
-            output += str(self.current_proof_state())
-            assert self.current_node is not None, "Current node is not initialized."
-            if self.current_node.tactic is None:
-                assert self.proof_tree is not None, "Proof tree is not initialized."
-                count = self.proof_tree.num_sorries()
+            output += str(node.proof_state)
+            tactic = node.tactic
+            if tactic is None:
+                tree = self.proof_tree
+                assert tree is not None, "Proof tree is not initialized."
+                count = tree.num_sorries()
                 if count > 1:
-                    _, before, _ = self.proof_tree.count_sorries(self.current_node)
+                    _, before, _ = tree.count_sorries(node)
                     output += f"\nThis is goal {before + 1} of {count}."
             else:
-                num_children = len(self.current_node.children)
+                num_children = len(node.children)
                 if num_children == 0:
-                    output += (
-                        f'\nThis goal was solved with "{self.current_node.tactic}".'
-                    )
+                    output += f'\nThis goal was solved with "{tactic}".'
                 else:
                     if num_children == 1:
-                        output += f'\nThe next step in the proof is "{self.current_node.tactic}".'
+                        output += f'\nThe next step in the proof is "{tactic}".'
                     else:
-                        output += f'\nThe next step in the proof is "{self.current_node.tactic}", generating {num_children} sub-goals.'
+                        output += f'\nThe next step in the proof is "{tactic}", generating {num_children} sub-goals.'
             return output
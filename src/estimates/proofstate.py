@@ -1,25 +1,300 @@
 from __future__ import annotations
 
+import sys
+from collections.abc import (
+    ItemsView,
+    Iterable,
+    Iterator,
+    KeysView,
+    Mapping,
+    MutableMapping,
+    ValuesView,
+)
+from enum import Enum
+from itertools import count
+from typing import TypeVar, overload
+
 from sympy import Basic
 
-from estimates.basic import Type, describe
+from estimates.basic import describe, is_decl
 from estimates.test import test
 
 ## Proof states describe the current state of a proof (a list of hypotheses and a goal).  The hypotheses are a dictionary of string-Basic pairs that match a hypothesis name to the sympy basic class they represent.  The goals are stored as sympy basic classes.
 
 ## Goals should be predicate objects.  Hypotheses can be either predicates or variables.  In the latter case, the name of the hypothesis should match the name of the variable.
 
+_T = TypeVar("_T")
+
+_versions = count()  # source of version numbers for Hypotheses; each number is only ever handed out once
+
+
+class Missing(Enum):
+    """The type of the MISSING sentinel."""
+
+    MISSING = "MISSING"
+
+
+MISSING = Missing.MISSING  # sentinel for hypotheses that are not present, to pass as the default of Hypotheses.get; an enum member so that type checkers can narrow it away
+
+
+class Hypotheses(MutableMapping[str, Basic]):
+    """
+    A dictionary of hypotheses that also keeps track of the variables declared in it, so that they do not need to be recomputed from scratch.  All modifications should go through the usual dictionary methods so that this index stays up to date.
+
+    Copies are copy-on-write: a copy shares its storage with the original, and each part of the storage is only duplicated when one of them first modifies that part.
+    """
+
+    _data: dict[str, Basic]         # The hypotheses themselves
+    _nonvar_hyps: dict[str, Basic]  # The hypotheses that are not variable declarations
+    _vars: set[Basic]               # The variables declared in the hypotheses
+    _var_to_name: dict[Basic, str]  # The first name under which each variable is declared
+    _var_counts: dict[Basic, int]   # The number of names under which each variable is declared
+    _name_counter: dict[str, int]   # For a name passed to new(), a number k such that the name with fewer than k primes added is known to be taken
+    _desc_cache: dict[str, tuple[Basic, str]]  # For each name, a hypothesis and its description; shared by all copies, and only used when the hypothesis matches
+    _version: int                   # Changes whenever the hypotheses change; two Hypotheses with the same version have the same contents
+    _shared: bool                   # Whether _data, _nonvar_hyps and _name_counter may be shared with a copy, and so must be replaced before they are modified
+    _vars_shared: bool              # Whether _vars, _var_to_name and _var_counts may be shared with a copy, and so must be duplicated before they are modified
+
+    __hash__ = None  # mutable, like dict
+
+    def __init__(self, hypotheses: Mapping[str, Basic] | None = None) -> None:
+        self._data = {}
+        self._nonvar_hyps = {}
+        self._vars = set()
+        self._var_to_name = {}
+        self._var_counts = {}
+        self._name_counter = {}
+        self._desc_cache = {}
+        self._version = next(_versions)
+        self._shared = False
+        self._vars_shared = False
+        if hypotheses is not None:
+            self.update(hypotheses)
+
+    def _modify(self) -> None:
+        """Prepare the storage for a modification, duplicating it first if it is shared with a copy.  The variable index is only duplicated when a declaration changes."""
+        if self._shared:
+            self._data = self._data.copy()
+            self._nonvar_hyps = self._nonvar_hyps.copy()
+            self._name_counter = {}  # an empty counter is always valid, and is cheaper than a copy
+            self._shared = False
+        self._version = next(_versions)
+
+    def _modify_vars(self) -> None:
+        """Prepare the variable index for a modification, duplicating it first if it is shared with a copy."""
+        if self._vars_shared:
+            self._vars = self._vars.copy()
+            self._var_to_name = self._var_to_name.copy()
+            self._var_counts = self._var_counts.copy()
+            self._vars_shared = False
+
+    def _forget(self, name: str, obj: Basic) -> None:
+        """Remove a hypothesis that is about to be overwritten or deleted from the index."""
+        if is_decl(obj):
+            self._remove_var(name, obj.var())
+        elif name in self._nonvar_hyps:
+            del self._nonvar_hyps[name]
+
+    def _first_name(self, var: Basic, exclude: str | None = None) -> str:
+        """Find the first name other than `exclude` under which a variable is declared, by searching the hypotheses."""
+        return next(
+            key
+            for key, obj in self._data.items()
+            if key != exclude and is_decl(obj) and obj.var() == var
+        )
+
+    def _add_var(self, name: str, var: Basic) -> None:
+        """Record that a variable is declared under the given name, which is already stored."""
+        self._modify_vars()
+        declared = self._var_counts.get(var, 0)
+        self._var_counts[var] = declared + 1
+        if declared == 0:
+            self._vars.add(var)
+            self._var_to_name[var] = name
+        elif self._var_to_name[var] != name:
+            # the variable is declared more than once, so find which name comes first
+            self._var_to_name[var] = self._first_name(var)
+
+    def _remove_var(self, name: str, var: Basic) -> None:
+        """Record that a variable is no longer declared under the given name."""
+        self._modify_vars()
+        declared = self._var_counts[var] - 1
+        if declared == 0:
+            del self._var_counts[var]
+            self._vars.discard(var)
+            del self._var_to_name[var]
+        else:
+            # the variable is still declared under another name
+            self._var_counts[var] = declared
+            if self._var_to_name[var] == name:
+                self._var_to_name[var] = self._first_name(var, exclude=name)
+
+    def _release(self, name: str) -> None:
+        """Update the name counters after a name has been freed up."""
+        base = name
+        primes = 0
+        while True:
+            if self._name_counter.get(base, 0) > primes:
+                self._name_counter[base] = primes
+            if not base.endswith("'"):
+                break
+            base = base[:-1]
+            primes += 1
+
+    def __getitem__(self, name: str) -> Basic:
+        return self._data[name]
+
+    def __setitem__(self, name: str, hypothesis: Basic) -> None:
+        name = sys.intern(name)  # so that later lookups with interned names can match on identity
+        self._modify()
+        was_var = False
+        if name in self._data:
+            old = self._data[name]
+            was_var = is_decl(old)
+            if was_var or is_decl(hypothesis):
+                self._forget(name, old)
+        self._data[name] = hypothesis
+        if is_decl(hypothesis):
+            self._add_var(name, hypothesis.var())
+        elif was_var:
+            # the hypothesis keeps its old position in self._data, so rebuild to keep the same order here
+            self._nonvar_hyps = {
+                key: obj for key, obj in self._data.items() if not is_decl(obj)
+            }
+        else:
+            self._nonvar_hyps[name] = hypothesis
+
+    def __delitem__(self, name: str) -> None:
+        self.pop(name)
+
+    @overload
+    def pop(self, name: str, /) -> Basic: ...
+    @overload
+    def pop(self, name: str, default: Basic, /) -> Basic: ...
+    @overload
+    def pop(self, name: str, default: _T, /) -> Basic | _T: ...
+    def pop(self, name: str, default: object = MISSING, /) -> object:
+        if name not in self._data:
+            if default is MISSING:
+                raise KeyError(name)
+            return default
+        self._modify()
+        obj = self._data.pop(name)
+        self._forget(name, obj)
+        self._release(name)
+        return obj
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Hypotheses):
+            return self._data == other._data
+        return self._data == other
+
+    def __repr__(self) -> str:
+        return f"Hypotheses({self._data!r})"
+
+    # Read-only access is passed straight through to the underlying dictionary, for speed.
+
+    @overload
+    def get(self, name: str, /) -> Basic | None: ...
+    @overload
+    def get(self, name: str, default: Basic | _T, /) -> Basic | _T: ...
+    def get(self, name: str, default: object = None, /) -> object:
+        return self._data.get(name, default)
+
+    def keys(self) -> KeysView[str]:
+        return self._data.keys()
+
+    def values(self) -> ValuesView[Basic]:
+        return self._data.values()
+
+    def items(self) -> ItemsView[str, Basic]:
+        return self._data.items()
+
+    def clear(self) -> None:
+        self._data = {}
+        self._nonvar_hyps = {}
+        self._vars = set()
+        self._var_to_name = {}
+        self._var_counts = {}
+        self._name_counter = {}
+        self._version = next(_versions)
+        self._shared = False
+        self._vars_shared = False
+
+    def copy(self) -> Hypotheses:
+        new = object.__new__(Hypotheses)  # skip __init__, as all of the storage is shared
+        new.__dict__.update(self.__dict__)
+        new._shared = new._vars_shared = self._shared = self._vars_shared = True
+        return new
+
+    @property
+    def version(self) -> int:
+        """A number that changes whenever the hypotheses change; two Hypotheses with the same version have the same contents."""
+        return self._version
+
+    def new(self, name: str) -> str:
+        """Return the first unused version of name (adding primes as needed)."""
+        if name not in self._data:
+            return name
+        # The counter only depends on the contents, so it can be updated even if it is shared with a copy.
+        primes = max(self._name_counter.get(name, 1), 1)
+        new_name = name + "'" * primes
+        while new_name in self._data:
+            primes += 1
+            new_name += "'"
+        self._name_counter[name] = primes
+        return new_name
+
+    def describe(self, name: str) -> str:
+        """Return a string description of the named hypothesis."""
+        obj = self._data[name]
+        cached = self._desc_cache.get(name)
+        if cached is not None and cached[0] is obj:
+            return cached[1]
+        desc = describe(name, obj)
+        self._desc_cache[name] = (obj, desc)
+        return desc
+
+    def get_all_vars(self) -> set[Basic]:
+        """Get all variables declared in the hypotheses.  The returned set is maintained in place, and should not be modified by the caller."""
+        return self._vars
+
+    def get_var_name(self, var: Basic) -> str:
+        """Get the name under which a variable is declared.  Raises KeyError if the variable is not declared."""
+        return self._var_to_name[var]
+
+    def non_variables(self) -> ValuesView[Basic]:
+        """Return a live view of the hypotheses that are not variable declarations.  The view should not be held on to across modifications."""
+        return self._nonvar_hyps.values()
+
 
 class ProofState:
     goal: Basic                    # The goal of the proof state
-    hypotheses: dict[str, Basic]   # A dictionary of hypotheses, where the key is the name of the hypothesis and the value is the sympy basic class it represents
+    hypotheses: Hypotheses         # A dictionary of hypotheses, where the key is the name of the hypothesis and the value is the sympy basic class it represents
+    _test_cache: dict[Basic, bool]  # Results of test() for each goal, valid for the hypotheses with version _test_version.  Shared between copies of a proof state until the hypotheses change.
+    _test_version: int              # The version of the hypotheses that _test_cache refers to
 
-    def __init__(self, goal: Basic, hypotheses: dict[str, Basic] | None = None) -> None:
+    def __init__(self, goal: Basic, hypotheses: Mapping[str, Basic] | Hypotheses | None = None) -> None:
         """
         Initialize a proof state with a goal, and an optional list of hypotheses.
         """
         self.goal = goal
-        self.hypotheses = hypotheses if hypotheses is not None else {}
+        if hypotheses is None:
+            hypotheses = Hypotheses()
+        elif not isinstance(hypotheses, Hypotheses):
+            hypotheses = Hypotheses(hypotheses)
+        self.hypotheses = hypotheses
+        self._test_cache = {}
+        self._test_version = hypotheses.version
 
     def set_goal(self, goal: Basic) -> None:
         """Set the goal of the proof state."""
@@ -29,7 +304,10 @@ class ProofState:
         """
         Create a copy of the proof state.
         """
-        return ProofState(self.goal, self.hypotheses.copy())
+        new = ProofState(self.goal, self.hypotheses.copy())
+        new._test_cache = self._test_cache
+        new._test_version = self._test_version
+        return new
 
     def eq(self, other: ProofState) -> bool:
         """
@@ -39,37 +317,35 @@ class ProofState:
 
     def new(self, name: str) -> str:
         """returns the first unused version of name (adding primes as needed) that isn't already claimed as a hypothesis"""
-        new_name = name
-        while new_name in self.hypotheses:
-            new_name += "'"
-        return new_name
+        return self.hypotheses.new(name)
 
     def remove_hypothesis(self, name: str) -> None:
         """Remove a hypothesis from the proof state."""
-        assert name in self.hypotheses, f"Hypothesis {name} not found in proof state."
-        if isinstance(self.hypotheses[name], Type):
+        obj = self.hypotheses.get(name, MISSING)
+        assert obj is not MISSING, f"Hypothesis {name} not found in proof state."
+        if is_decl(obj):
             raise ValueError(
                 f"Hypothesis {name} is a variable declaration.  Removing variables is currently unimplemented."
             )
             # TODO: allow for variables to be removed if no hypotheses or goals uses them
         else:
-            del self.hypotheses[name]
+            self.hypotheses.pop(name)
 
     def get_hypothesis(self, name: str) -> Basic:
         """Get a hypothesis from the proof state."""
-        assert name in self.hypotheses, f"Hypothesis {name} not found in proof state."
-        obj = self.hypotheses[name]
-        if isinstance(obj, Type):
+        obj = self.hypotheses.get(name, MISSING)
+        assert obj is not MISSING, f"Hypothesis {name} not found in proof state."
+        if is_decl(obj):
             raise ValueError(
                 f"Hypothesis {name} is a variable declaration.  Use get_var() to get the variable."
             )
-        return self.hypotheses[name]
+        return obj
 
     def get_var(self, name: str) -> Basic:
         """Get a variable from the proof state."""
-        assert name in self.hypotheses, f"Variable {name} not found in proof state."
-        obj = self.hypotheses[name]
-        if isinstance(obj, Type):
+        obj = self.hypotheses.get(name, MISSING)
+        assert obj is not MISSING, f"Variable {name} not found in proof state."
+        if is_decl(obj):
             return obj.var()
         else:
             raise ValueError(
@@ -78,35 +354,31 @@ class ProofState:
 
     def get_var_name(self, var: Basic) -> str:
         """Get the name of a variable from the proof state."""
-        for name, obj in self.hypotheses.items():
-            if isinstance(obj, Type) and obj.var() == var:
-                return name
-        raise ValueError(f"Variable {var} not found in proof state.")
+        try:
+            return self.hypotheses.get_var_name(var)
+        except KeyError:
+            raise ValueError(f"Variable {var} not found in proof state.") from None
 
     def get_all_vars(self) -> set[Basic]:
-        """Get all variables from the proof state."""
-        vars = set()
-        for obj in self.hypotheses.values():
-            if isinstance(obj, Type):
-                vars.add(obj.var())
-        return vars
+        """Get all variables from the proof state.  The returned set should not be modified."""
+        return self.hypotheses.get_all_vars()
 
     def rename_hypothesis(self, old_name: str, new_name: str) -> str:
         """Rename a hypothesis in the proof state."""
-        if old_name in self.hypotheses:
+        hyp = self.hypotheses.get(old_name, MISSING)
+        if hyp is not MISSING:
             if new_name in self.hypotheses:
                 raise ValueError(
                     f"Hypothesis {new_name} already exists.  Please choose a different name."
                 )
             else:
-                if isinstance(self.hypotheses[old_name], Type):
+                if is_decl(hyp):
                     raise ValueError(
                         f"Hypothesis {old_name} is a variable declaration.  Renaming variables is currently unimplemented."
                     )
                     # May be best to keep this functionality disabled, as things get confusing if the proofstate name and the sympy name for a variable are permitted to diverge.  Alternatively, if one renames a proofstate variable, one could create a sympy variable with the new name and swap all occurrences of the old name with the new name.  This may be a bit of a pain to implement, though.
                 else:
-                    hyp = self.hypotheses[old_name]
-                    del self.hypotheses[old_name]
+                    hyp = self.hypotheses.pop(old_name)
                     new_name = self.new(new_name)
                     self.hypotheses[new_name] = hyp
                     return new_name
@@ -124,19 +396,31 @@ class ProofState:
         if variables:
             return list(self.hypotheses.values())
         else:
-            return [
-                var for var in self.hypotheses.values() if not isinstance(var, Type)
-            ]
+            return list(self.hypotheses.non_variables())
+
+    def iter_hypotheses(self) -> Iterable[Basic]:
+        """Iterate over the hypotheses in the proof state, excluding variable declarations, without building a list."""
+        return self.hypotheses.non_variables()
 
     def test(self, goal: Basic, verbose: bool = True) -> bool:
         """
         Check if a goal follows immediately from the stated hypotheses, including from the implicit ones.
         """
-        return test(self.hypotheses.values(), goal, verbose)
+        version = self.hypotheses.version
+        if version != self._test_version:
+            # the hypotheses have changed, so start a new cache rather than adding to one that may be shared with copies
+            self._test_cache = {}
+            self._test_version = version
+        result = self._test_cache.get(goal)
+        if result is None or (result and verbose):
+            # a positive result is recomputed in verbose mode so that the justifying hypothesis gets printed
+            result = test(self.hypotheses.values(), goal, verbose)
+            self._test_cache[goal] = result
+        return result
 
     def __str__(self) -> str:
         output = []
-        for name, hypothesis in self.hypotheses.items():
-            output.append(describe(name, hypothesis))
+        for name in self.hypotheses:
+            output.append(self.hypotheses.describe(name))
         output.append(f"|- {self.goal}")
         return "\n".join(output)
@@ -12,6 +12,8 @@ class ProofTree:
     Each node has a proof state, a parent node, a tactic used to transform the proof state, and a list of child nodes.
     """
 
+    _sorry_positions_stale = True  # For the root, whether the linked list of sorries has changed since the positions were last computed; only ever set on the root
+
     def __init__(self, proof_state: ProofState) -> None:
         """
         Initialize a proof tree node with a proof state.
@@ -22,24 +24,142 @@ class ProofTree:
             None  # Proof trees are initialized as a "sorry", so the tactic is None
         )
         self.children = []  # Must be empty if self.tactic is None; can also be empty if self.tactic completes the goal
+        # Cached information about the sorries in this subtree, kept up to date by _update_sorries.
+        self._sorry_count = 1  # The number of sorries in this subtree
+        self._sorry_head = self  # The first sorry in this subtree, or None if there are none
+        self._sorry_tail = self  # The last sorry in this subtree, or None if there are none
+        # If this node is a sorry, the neighbouring sorries in the proof tree, so that the sorries form a doubly linked list.
+        self._sorry_prev = None
+        self._sorry_next = None
+        self._sorry_pos = 0  # If this node is a sorry, its index in the linked list; only valid if the root's positions are not stale
 
-    def add_sorry(self, proof_state: ProofState) -> ProofTree:
-        """Add a child proof tree node as a 'sorry'."""
+    def _root(self) -> ProofTree:
+        """Return the root of the proof tree containing this node."""
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def _sorry_position(self) -> int:
+        """Return the index of this sorry node in the linked list of sorries, renumbering the list first if it has changed."""
+        root = self._root()
+        if root._sorry_positions_stale:
+            pos = 0
+            node = root._sorry_head
+            while node is not None:
+                node._sorry_pos = pos
+                pos += 1
+                node = node._sorry_next
+            root._sorry_positions_stale = False
+        return self._sorry_pos
+
+    def _contains(self, node: ProofTree | None) -> bool:
+        """Return True if the given node lies in this subtree."""
+        while node is not None:
+            if node is self:
+                return True
+            node = node.parent
+        return False
+
+    def _outside_sorries(self) -> tuple[ProofTree | None, ProofTree | None]:
+        """Return the last sorry before this subtree and the first sorry after it."""
+        if self._sorry_head is not None:
+            return self._sorry_head._sorry_prev, self._sorry_tail._sorry_next
+        # This subtree has no sorries, so search the earlier siblings of this node and of its ancestors.
+        node = self
+        while node.parent is not None:
+            siblings = node.parent.children
+            for sibling in reversed(siblings[: siblings.index(node)]):
+                if sibling._sorry_tail is not None:
+                    return sibling._sorry_tail, sibling._sorry_tail._sorry_next
+            node = node.parent
+        return None, node._sorry_head
+
+    def _collect_sorries(self) -> list[ProofTree]:
+        """Return the sorries in this subtree by traversing it, skipping subtrees without sorries."""
+        if self._sorry_count == 0:
+            return []
+        elif self.tactic is None:
+            return [self]
+        else:
+            return [sorry for child in self.children for sorry in child._collect_sorries()]
+
+    def _update_sorries(
+        self, before: ProofTree | None, after: ProofTree | None
+    ) -> None:
+        """
+        Update the cached sorry information after the tactic or children of this node have changed.  `before` and `after` are the sorries immediately before and after this subtree, as returned by _outside_sorries before the change.
+        """
+        node = self
+        while node is not None:
+            if node.tactic is None:
+                count, head, tail = 1, node, node
+            else:
+                count = sum(child._sorry_count for child in node.children)
+                head = next(
+                    (c._sorry_head for c in node.children if c._sorry_head is not None), None
+                )
+                tail = next(
+                    (c._sorry_tail for c in reversed(node.children) if c._sorry_tail is not None),
+                    None,
+                )
+            if node is not self and (count, head, tail) == (
+                node._sorry_count,
+                node._sorry_head,
+                node._sorry_tail,
+            ):
+                break  # the remaining ancestors are unaffected
+            node._sorry_count, node._sorry_head, node._sorry_tail = count, head, tail
+            node = node.parent
+
+        # splice the sorries of this subtree into the linked list, in place of the old ones
+        if self.tactic is not None:
+            self._sorry_prev = self._sorry_next = None
+        last = before
+        for sorry in self._collect_sorries():
+            sorry._sorry_prev = last
+            if last is not None:
+                last._sorry_next = sorry
+            last = sorry
+        if last is not None:
+            last._sorry_next = after
+        if after is not None:
+            after._sorry_prev = last
+        self._root()._sorry_positions_stale = True
+
+    def _new_child(self, proof_state: ProofState) -> ProofTree:
+        """Add a child 'sorry' node, without updating the cached sorry information."""
         child = ProofTree(proof_state)
         child.parent = self
         self.children.append(child)
         return child
 
+    def add_sorry(self, proof_state: ProofState) -> ProofTree:
+        """Add a child proof tree node as a 'sorry'."""
+        before, after = self._outside_sorries()
+        child = self._new_child(proof_state)
+        self._update_sorries(before, after)
+        return child
+
     def use_tactic(self, tactic: Tactic) -> bool:
         """Apply a tactic to the proof state and create child nodes for each resulting proof state."""
         proof_state_list = tactic.activate(self.proof_state)
         if len(proof_state_list) == 1 and proof_state_list[0].eq(self.proof_state):
             return False  # This tactic did nothing, so don't add a child node
+        before, after = self._outside_sorries()
         self.tactic = tactic
         for proof_state in proof_state_list:
-            self.add_sorry(proof_state)
+            self._new_child(proof_state)
+        self._update_sorries(before, after)
         return True
 
+    def clear_tactic(self) -> None:
+        """Turn this node back into a 'sorry', discarding its tactic and children."""
+        before, after = self._outside_sorries()
+        self.tactic = None
+        self.children = []
+        self._update_sorries(before, after)
+
     def rstr(
         self,
         indent: str = "  ",
@@ -81,10 +201,20 @@ class ProofTree:
 
     def list_sorries(self, exclude: list[ProofTree] | None = None) -> list[ProofTree]:
         """Return a list of sorry nodes in the proof tree, optionally excluding a given node."""
-        if exclude is None:
-            exclude = []
+        if not exclude:
+            # walk the linked list of sorries
+            sorries = []
+            node = self._sorry_head
+            while node is not None:
+                sorries.append(node)
+                if node is self._sorry_tail:
+                    break
+                node = node._sorry_next
+            return sorries
         if self in exclude:
             return []
+        elif self._sorry_count == 0:
+            return []  # nothing to find in this subtree
         elif self.tactic is None:
             return [self]
         else:
@@ -95,95 +225,65 @@ class ProofTree:
 
     def num_sorries(self, exclude: list[ProofTree] | None = None) -> int:
         """Return the number of sorries in the proof tree, optionally excluding a given node."""
-        if exclude is None:
-            exclude = []
+        if not exclude:
+            return self._sorry_count
         return len(self.list_sorries(exclude))
 
+    def has_sorry(self, node: ProofTree) -> bool:
+        """Return True if the given node is a sorry in this proof tree."""
+        return node.tactic is None and self._contains(node)
+
     def is_sorry_free(self) -> bool:
         """Return True if the proof tree is free of sorries."""
         return self.num_sorries() == 0
 
     def first_sorry(self) -> ProofTree | None:
         """Return the first sorry node in the proof tree."""
-        sorries = self.list_sorries()
-        if len(sorries) == 0:
-            return None
-        else:
-            return sorries[0]
+        return self._sorry_head
 
     def last_sorry(self) -> ProofTree | None:
         """Return the last sorry node in the proof tree."""
-        sorries = self.list_sorries()
-        if len(sorries) == 0:
-            return None
-        else:
-            return sorries[len(sorries) - 1]
+        return self._sorry_tail
 
     def find_sorry(
         self, target: ProofTree
     ) -> tuple[bool, ProofTree | None, ProofTree | None]:
         """
-        Recursively find the last sorry before a target and the first sorry after a target.
+        Find the last sorry before a target and the first sorry after a target, where the sorries below the target count as coming after it.
         Also returns whether the target was found in the tree.
         """
-        if self == target:
-            for child in self.children:
-                _, _, first = child.find_sorry(target)
-                if first is not None:
-                    return True, None, first
-            return True, None, None
-        if self.tactic is None:
-            return False, self, self
-        before = None
-        after = None
-        found_target = False
-        for child in self.children:
-            found, last_before, first_after = child.find_sorry(target)
-            if found:
-                found_target = True
-                if last_before is not None:
-                    before = last_before
-                after = first_after
-            else:
-                if found_target:
-                    if after is None:
-                        after = first_after
-                else:
-                    before = last_before
-        return (found_target, before, after)
+        if not self._contains(target):
+            return False, None, None
+        before, after = target._outside_sorries()
+        if target.tactic is not None and target._sorry_head is not None:
+            after = target._sorry_head
+        if before is not None and not self._contains(before):
+            before = None
+        if after is not None and not self._contains(after):
+            after = None
+        return True, before, after
 
     def count_sorries(self, target: ProofTree) -> tuple[bool, int, int]:
         """
-        Recursively count the number of sorries before and after a target in the proof tree.
+        Count the number of sorries before and after a target in the proof tree, where the sorries below the target count as coming before it.
         Also returns whether the target was found in the tree.
         """
-        if self == target:
+        if not self._contains(target):
+            return False, 0, 0
+        head = self._sorry_head
+        if head is None:
+            return True, 0, 0
+        if target.tactic is None:
+            before = target._sorry_position() - head._sorry_position()
+            return True, before, self._sorry_count - before - 1
+        last_before = target._sorry_tail
+        if last_before is None:
+            last_before, _ = target._outside_sorries()
+        if last_before is not None and self._contains(last_before):
+            before = last_before._sorry_position() - head._sorry_position() + 1
+        else:
             before = 0
-            after = 0
-            for child in self.children:
-                found, before_count, after_count = child.count_sorries(target)
-                if found:
-                    after += after_count
-                else:
-                    before += before_count
-            return True, before, after
-        if self.tactic is None:
-            return False, 1, 1
-        before = 0
-        after = 0
-        found_target = False
-        for child in self.children:
-            found, before_count, after_count = child.count_sorries(target)
-            if found:
-                found_target = True
-                before += before_count
-                after += after_count
-            else:
-                if found_target:
-                    after += after_count
-                else:
-                    before += before_count
-        return (found_target, before, after)
+        return True, before, self._sorry_count - before
 
     def __str__(self) -> str:
         return self.rstr_join()
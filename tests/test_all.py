@@ -1,6 +1,9 @@
 import pytest
+from sympy import Sum, Symbol
 
+from estimates.basic import Type
 from estimates.main import *
+from estimates.proofstate import Hypotheses
 
 class TestAll(object):
 
@@ -101,3 +104,121 @@ class TestAll(object):
     def test_sympy_simplify_solution(self, capsys):
         sympy_simplify_solution()
         self.proof_complete(capsys)
+
+    def nested_goals_exercise(self):
+        # builds the proof tree split_goal[sorry, by_cases[sorry, sorry], sorry]
+        p = ProofAssistant()
+        a, b, c = p.vars("bool", "a", "b", "c")
+        p.begin_proof(a & b & (a | c))
+        p.use(SplitGoal())
+        p.next_goal()
+        p.use(ByCases(c))
+        return p
+
+    def test_nested_goals_navigation(self, capsys):
+        p = self.nested_goals_exercise()
+        capsys.readouterr()
+        p.first_goal()
+        p.next_goal()
+        p.next_goal()
+        p.next_goal()
+        p.next_goal()
+        p.previous_goal()
+        captured = capsys.readouterr()
+        assert captured.out == (
+            "Moved to goal 1 of 4.\n"
+            + "Moved to goal 2 of 4.\n"
+            + "Moved to goal 3 of 4.\n"
+            + "Moved to goal 4 of 4.\n"
+            + "No subsequent goal to move to.\n"
+            + "Moved to goal 3 of 4.\n"
+        )
+
+    def test_nested_goals_next_goal_from_tactic(self, capsys):
+        p = self.nested_goals_exercise()
+        p.go_back()
+        capsys.readouterr()
+        p.next_goal()  # the goals below a tactic come after it
+        captured = capsys.readouterr()
+        assert captured.out == "Moved to goal 2 of 4.\n"
+
+    def test_nested_goals_count_sorries(self):
+        p = self.nested_goals_exercise()
+        tree = p.proof_tree
+        by_cases = tree.children[1]
+        # the goals below a tactic count as coming before it
+        assert tree.count_sorries(by_cases) == (True, 3, 1)
+        assert tree.count_sorries(tree) == (True, 4, 0)
+        assert tree.count_sorries(by_cases.children[1]) == (True, 2, 1)
+        assert by_cases.count_sorries(by_cases.children[0]) == (True, 0, 1)
+
+    def test_assume_with_bound_variable(self):
+        p = ProofAssistant()
+        x = p.var("real", "x")
+        n = Symbol("n")
+        # n is bound by the sum, but is not a declared variable
+        with pytest.raises(ValueError):
+            p.assume(Sum(x * n, (n, 1, 3)) > 0, "h")
+        p.assume(Sum(n, (n, 1, 3)) > x, "h")
+        assert "h" in p.hypotheses
+
+
+class TestHypotheses:
+
+    def test_copy_is_independent(self):
+        x, y, z = Symbol("x"), Symbol("y"), Symbol("z")
+        h = Hypotheses({"x": Type(x), "h": x > 0})
+        c = h.copy()
+        c["y"] = Type(y)
+        c["h2"] = y > 0
+        del h["h"]
+        h["z"] = Type(z)
+        assert dict(h) == {"x": Type(x), "z": Type(z)}
+        assert dict(c) == {"x": Type(x), "h": x > 0, "y": Type(y), "h2": y > 0}
+        assert h.get_all_vars() == {x, z}
+        assert c.get_all_vars() == {x, y}
+        assert list(h.non_variables()) == []
+        assert list(c.non_variables()) == [x > 0, y > 0]
+
+    def test_var_declared_under_two_names(self):
+        x = Symbol("x")
+        h = Hypotheses()
+        h["a"] = Type(x)
+        h["b"] = Type(x)
+        assert h.get_var_name(x) == "a"
+        del h["a"]
+        assert h.get_var_name(x) == "b"
+        assert h.get_all_vars() == {x}
+        del h["b"]
+        assert h.get_all_vars() == set()
+        with pytest.raises(KeyError):
+            h.get_var_name(x)
+
+    def test_pop_missing_with_default(self):
+        h = Hypotheses({"h": Symbol("x") > 0})
+        assert h.pop("missing", None) is None
+        assert h.pop("missing", 3) == 3
+        with pytest.raises(KeyError):
+            h.pop("missing")
+        assert len(h) == 1
+
+    def test_version(self):
+        x = Symbol("x")
+        h = Hypotheses({"x": Type(x)})
+        c = h.copy()
+        assert c.version == h.version and c == h
+        c["h"] = x > 0
+        h["h"] = x < 0
+        assert c.version != h.version
+        assert h.copy().version == h.version
+
+    def test_new_after_primed_name_is_removed(self):
+        x = Symbol("x") > 0
+        h = Hypotheses({"x": x, "x'": x, "x''": x})
+        assert h.new("x") == "x'''"
+        c = h.copy()
+        c.pop("x'")
+        assert c.new("x") == "x'"
+        assert h.new("x") == "x'''"
+        h.pop("x'")
+        assert h.new("x") == "x'"